@@ -1,12 +1,15 @@
 # -*- coding: UTF-8 -*-
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 
 
 def preprocess(img):
-    # 转换为灰度图
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    # 转换为灰度图（已是灰度图则跳过）
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     # 二值化
     img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
     # 膨胀
@@ -21,8 +24,8 @@ def preprocess_adaptive(img):
     # 高斯模糊
     # blurred = cv2.GaussianBlur(img, (1, 1), 0)
 
-    # 灰度化
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    # 灰度化（已是灰度图则跳过）
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     # 自适应阈值化
     thresholded = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
 
@@ -36,6 +39,7 @@ def preprocess_adaptive(img):
 def find_corners(img):
     """
     Finds the 4 extreme corners of the largest contour in the image.
+    Returns None if the image has no contours (e.g. an all-black frame).
     """
     # OpenCV版本问题，cv2.findContours 版本3返回值有3个，版本4只有2个
     opencv_version = cv2.__version__.split('.')[0]
@@ -45,49 +49,30 @@ def find_corners(img):
     else:
         contours, _ = cv2.findContours(img.copy(), cv2.RETR_EXTERNAL,
                                        cv2.CHAIN_APPROX_SIMPLE)
-    # 找到最大的轮廓
-    contours = sorted(contours, key=cv2.contourArea, reverse=True)
-    polygon = contours[0]
+    if not contours:
+        return None
+    # 找到最大的轮廓（只取最大值，不对全部轮廓排序）
+    polygon = max(contours, key=cv2.contourArea).reshape(-1, 2)
 
     # bottom-right point has the largest (x + y) value
     # top-left has point smallest (x + y) value
     # bottom-left point has smallest (x - y) value
     # top-right point has largest (x - y) value
-
-    # 初始化
-    val_br = polygon[0][0][0] + polygon[0][0][1]
-    val_tl = polygon[0][0][0] + polygon[0][0][1]
-    val_bl = polygon[0][0][0] - polygon[0][0][1]
-    val_tr = polygon[0][0][0] - polygon[0][0][1]
-    bottom_right = polygon[0][0]
-    top_left = polygon[0][0]
-    bottom_left = polygon[0][0]
-    top_right = polygon[0][0]
-
-    # 寻找最大轮廓的4个边界点坐标
-    for i in range(1, len(polygon)):
-        val_add = polygon[i][0][0] + polygon[i][0][1]
-        val_minus = polygon[i][0][0] - polygon[i][0][1]
-        if val_add > val_br:
-            val_br = val_add
-            bottom_right = polygon[i][0]
-        if val_add < val_tl:
-            val_tl = val_add
-            top_left = polygon[i][0]
-        if val_minus < val_bl:
-            val_bl = val_minus
-            bottom_left = polygon[i][0]
-        if val_minus > val_tr:
-            val_tr = val_minus
-            top_right = polygon[i][0]
+    # 向量化计算4个边界点，相同取值时与逐点扫描一样取第一个
+    val_add = polygon[:, 0] + polygon[:, 1]
+    val_minus = polygon[:, 0] - polygon[:, 1]
+    top_left = polygon[np.argmin(val_add)]
+    bottom_right = polygon[np.argmax(val_add)]
+    bottom_left = polygon[np.argmin(val_minus)]
+    top_right = polygon[np.argmax(val_minus)]
     # 返回4个边界点坐标
     return [top_left, top_right, bottom_right, bottom_left]
 
 
 # 得到PPT图片的4个边界点坐标
-def crop_and_warp(img, crop_rect):
+def crop_and_warp(img, crop_rect, size=(800, 600)):
     """
-    Crops and warps a rectangular section from an image into a square of similar size.
+    Crops and warps a rectangular section from an image into a rectangle of the given (width, height).
     """
     # 4个边界点坐标
     top_left, top_right, bottom_right, bottom_left = \
@@ -97,7 +82,7 @@ def crop_and_warp(img, crop_rect):
     # 原始坐标
     src = np.array([top_left, top_right, bottom_right, bottom_left], dtype='float32')
 
-    width, height = 800, 600  # 设置矫正后的图像尺寸
+    width, height = size  # 矫正后的图像尺寸
     dst = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1], ], dtype=np.float32)
 
     # Gets the transformation matrix for skewing the image to fit a square by comparing the 4 before and after points
@@ -171,29 +156,204 @@ def merge_crop_rect(crop_rect, crop_rect_adaptive, threshold=50):
         return crop_rect_adaptive
 
 
+# 在缩小的灰度图上检测得到的坐标换算回原图坐标（按像素中心对齐）
+def scale_crop_rect(crop_rect, scale_x, scale_y):
+    crop_rect = np.array(crop_rect, dtype='float32')
+    crop_rect[:, 0] = (crop_rect[:, 0] + 0.5) * scale_x - 0.5
+    crop_rect[:, 1] = (crop_rect[:, 1] + 0.5) * scale_y - 0.5
+    return crop_rect
+
+
+# 检测PPT的4个边界点（原图坐标）
+# detect_width: 指定时在缩小到该宽度的灰度图上检测边界点，再换算回原图
+# timings: 可选的字典，记录各阶段耗时
+# 任一种预处理结果中没有轮廓（如全黑的画面）时返回 None
+def detect_crop_rect(img_origin, detect_width=None, timings=None):
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    # 预处理：灰度化只做一次，两种预处理共用
+    gray = cv2.cvtColor(img_origin, cv2.COLOR_BGR2GRAY)
+    origin_height, origin_width = gray.shape[:2]
+    if detect_width and origin_width > detect_width:
+        detect_height = max(1, round(origin_height * detect_width / origin_width))
+        gray = cv2.resize(gray, (detect_width, detect_height), interpolation=cv2.INTER_AREA)
+    img = preprocess(gray)
+    adaptive = preprocess_adaptive(gray)
+    timings['preprocess'] = time.perf_counter() - start
+
+    # 得到PPT图片的4个边界点坐标
+    start = time.perf_counter()
+    crop_rect = find_corners(img)
+    crop_rect_adaptive = find_corners(adaptive)
+    timings['find_corners'] = time.perf_counter() - start
+    if crop_rect is None or crop_rect_adaptive is None:
+        return None
+
+    # 合并两种方法得到的边界点坐标，排除异常值
+    start = time.perf_counter()
+    height, width = img.shape[:2]
+    crop_rect_final = merge_crop_rect(crop_rect, crop_rect_adaptive, threshold=width / 20)
+    if width != origin_width:
+        crop_rect_final = scale_crop_rect(crop_rect_final, origin_width / width, origin_height / height)
+    timings['merge_crop_rect'] = time.perf_counter() - start
+    return crop_rect_final
+
+
+# 单张PPT照片矫正，返回 (矫正后的图像, 各阶段耗时)
+# 只在原图上做一次透视变换
+def rectify(img_origin, size=(800, 600), detect_width=None):
+    timings = {}
+    crop_rect_final = detect_crop_rect(img_origin, detect_width, timings)
+    if crop_rect_final is None:
+        raise ValueError('未检测到PPT轮廓')
+
+    # 矫正
+    start = time.perf_counter()
+    img = crop_and_warp(img_origin, crop_rect_final, size)
+    timings['crop_and_warp'] = time.perf_counter() - start
+    return img, timings
+
+
+# 进程池工作函数：读取、矫正、保存一张图片，返回 (文件名, 各阶段耗时, 错误信息)
+def _rectify_file(file_src, file_dst, size, detect_width=None):
+    timings = {}
+    try:
+        start = time.perf_counter()
+        img_origin = cv2.imread(file_src)
+        if img_origin is None:
+            raise IOError('无法读取图像')
+        timings['read'] = time.perf_counter() - start
+        img, stage_timings = rectify(img_origin, size, detect_width)
+        timings.update(stage_timings)
+        start = time.perf_counter()
+        if not cv2.imwrite(file_dst, img):
+            raise IOError('无法写入图像')
+        timings['write'] = time.perf_counter() - start
+    except Exception as e:
+        return file_src, timings, str(e)
+    return file_src, timings, None
+
+
+# 批量矫正 folder_src 中的图片，结果以同名文件写入 folder_dst
+# size: 输出图像 (宽, 高)；workers: 进程数，默认 CPU 核数；detect_width: 见 rectify
+# 返回 {'done': 成功数, 'failed': [(文件, 错误)], 'timings': {阶段: 总耗时}, 'seconds': 总耗时}
+def rectify_folder(folder_src, folder_dst, size=(800, 600), workers=None, detect_width=None):
+    start = time.perf_counter()
+    os.makedirs(folder_dst, exist_ok=True)
+    files = sorted(file for file in os.listdir(folder_src) if os.path.isfile(os.path.join(folder_src, file)))
+    files_src = [os.path.join(folder_src, file) for file in files]
+    files_dst = [os.path.join(folder_dst, file) for file in files]
+    result = {'done': 0, 'failed': [], 'timings': {}, 'seconds': 0.0}
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        results = executor.map(_rectify_file, files_src, files_dst, [size] * len(files),
+                               [detect_width] * len(files), chunksize=4)
+        for file_src, timings, error in results:
+            for stage, seconds in timings.items():
+                result['timings'][stage] = result['timings'].get(stage, 0.0) + seconds
+            if error is None:
+                result['done'] += 1
+            else:
+                result['failed'].append((file_src, error))
+                print(f"{file_src} 矫正失败：{error}")
+
+    result['seconds'] = time.perf_counter() - start
+    print(f"矫正完成 {result['done']}/{len(files)} 张，失败 {len(result['failed'])} 张，耗时 {result['seconds']:.1f}s")
+    for stage, seconds in result['timings'].items():
+        print(f"  {stage}: 共 {seconds:.2f}s，平均 {seconds / max(len(files), 1) * 1000:.1f}ms/张")
+    return result
+
+
+# 灰度缩略图，用于帧间差异比较
+def _thumbnail(img, width=160):
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    height = max(1, round(gray.shape[0] * width / gray.shape[1]))
+    return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+
+
+# 两张缩略图中明显变化（灰度差超过 pixel_threshold）的像素比例
+def _frame_diff(thumb1, thumb2, pixel_threshold=32):
+    return float(np.count_nonzero(cv2.absdiff(thumb1, thumb2) > pixel_threshold)) / thumb1.size
+
+
+# 从视频中矫正PPT，只在幻灯片内容变化时产出 (帧号, 矫正后的图像)
+# 只在关键帧上完整检测边界点：首帧、每隔 keyframe_interval 帧、或画面与上一关键帧相比变化的像素比例超过 scene_threshold，
+# 其余帧沿用上一次的 crop_rect，每帧只做一次透视变换
+# change_threshold: 矫正结果与上一次输出相比变化的像素比例超过该值才输出
+# frame_step: 每隔多少帧处理一帧，其余帧只 grab 不解码
+def iter_video_slides(video_path, size=(800, 600), detect_width=1000, keyframe_interval=150,
+                      scene_threshold=0.05, change_threshold=0.01, frame_step=1):
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise IOError(f'无法打开视频：{video_path}')
+    crop_rect, key_index, key_thumb, emitted_thumb = None, 0, None, None
+    index = -1
+    try:
+        while True:
+            index += 1
+            if index % frame_step:
+                if not capture.grab():
+                    break
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+
+            thumb = _thumbnail(frame)
+            if crop_rect is None or index - key_index >= keyframe_interval \
+                    or _frame_diff(thumb, key_thumb) > scene_threshold:
+                # 检测不到轮廓（如开头的黑屏淡入）时沿用上一个关键帧的边界点，还没有时跳过该帧
+                detected = detect_crop_rect(frame, detect_width)
+                if detected is not None:
+                    crop_rect = detected
+                key_index, key_thumb = index, thumb
+                if crop_rect is None:
+                    continue
+
+            img = crop_and_warp(frame, crop_rect, size)
+            img_thumb = _thumbnail(img)
+            if emitted_thumb is None or _frame_diff(img_thumb, emitted_thumb) > change_threshold:
+                emitted_thumb = img_thumb
+                yield index, img
+    finally:
+        capture.release()
+
+
+# 视频中每张变化的幻灯片保存为 folder_dst/slide_帧号.jpg，返回保存的张数
+def rectify_video(video_path, folder_dst, size=(800, 600), **kwargs):
+    start = time.perf_counter()
+    os.makedirs(folder_dst, exist_ok=True)
+    count = 0
+    for index, img in iter_video_slides(video_path, size, **kwargs):
+        if not cv2.imwrite(os.path.join(folder_dst, f'slide_{index:06d}.jpg'), img):
+            raise IOError(f'无法写入第 {index} 帧的幻灯片')
+        count += 1
+        print(f"第 {index} 帧：保存第 {count} 张幻灯片")
+    print(f"视频处理完成，共 {count} 张幻灯片，耗时 {time.perf_counter() - start:.1f}s")
+    return count
+
+
+# 例如：python PPTps.py src/ dst/ --size 1280x720 --workers 8 --detect-width 1000
+#      python PPTps.py --video lecture.mp4 --size 1280x720    （幻灯片保存到 dst/）
 if __name__ == '__main__':
-    file_src = 'src/'
-    file_dst = 'dst/'
-    files = os.listdir(file_src)
-    for file in files:
-        # 读取图片
-        img_origin = cv2.imread(file_src + file)
-        # img_origin = cv2.imread('static/src/test(5).jpg')
-        # 预处理
-        img = preprocess(img_origin)
-        adaptive = preprocess_adaptive(img_origin)
-        # 得到PPT图片的4个边界点坐标
-        crop_rect = find_corners(img)
-        crop_rect_adaptive = find_corners(adaptive)
-
-        # 合并两种方法得到的边界点坐标，排除异常值
-        height, width = img.shape[:2]
-        crop_rect_final = merge_crop_rect(crop_rect, crop_rect_adaptive, threshold=width / 20)
-
-        # 矫正
-        img = crop_and_warp(img_origin, crop_rect_final)
-
-        # cv2.imshow("image", img)
-        # cv2.waitKey(0)
-        # cv2.destroyAllWindows()
-        cv2.imwrite(file_dst + file, img)
+    import argparse
+
+    parser = argparse.ArgumentParser(description='PPT照片批量矫正')
+    parser.add_argument('folder_src', nargs='?', default='src/', help='输入目录')
+    parser.add_argument('folder_dst', nargs='?', default='dst/', help='输出目录')
+    parser.add_argument('--size', default='800x600', help='输出尺寸 宽x高')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认CPU核数')
+    parser.add_argument('--detect-width', type=int, default=None, help='在缩小到该宽度的图像上检测边界点，如 1000')
+    parser.add_argument('--video', default=None, help='视频文件，指定时处理该视频，幻灯片保存到 folder_dst')
+    args = parser.parse_args()
+
+    out_size = tuple(int(v) for v in args.size.lower().split('x'))
+    if args.video:
+        rectify_video(args.video, args.folder_dst, size=out_size, detect_width=args.detect_width or 1000)
+    else:
+        rectify_folder(args.folder_src, args.folder_dst, size=out_size, workers=args.workers,
+                       detect_width=args.detect_width)
+    # img, _ = rectify(cv2.imread('static/src/test(5).jpg'))
+    # cv2.imshow("image", img)
+    # cv2.waitKey(0)
+    # cv2.destroyAllWindows()
@@ -1,55 +1,385 @@
 # -*- coding: UTF-8 -*-
 import os
+import hashlib
+import sqlite3
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from fnmatch import fnmatch
 """
 Created on file content analysis
 @author: <LMM>
 """
 
 
+# 列出单个目录，返回 (匹配的文件, 需继续扫描的子目录)；DirEntry 自带类型信息，不额外 stat
+def _scan_dir(dir_path, suffix=None, exclude=()):
+    files, subdirs = [], []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if exclude and any(fnmatch(entry.name, pattern) for pattern in exclude):
+                    continue
+                if entry.is_dir():
+                    # 与 os.walk 一致，不进入指向目录的符号链接
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                elif suffix is None or entry.name.endswith(suffix):
+                    files.append(entry.path)
+    except OSError as e:
+        print(f"无法读取目录 {dir_path}：{e}")
+    return files, subdirs
+
+
+# 基于 os.scandir 的目录扫描，逐个产出匹配的文件路径（产出顺序不固定）
+# suffix: 后缀或后缀列表，如 ['.jpg', '.png']；exclude: 排除的文件名/目录名通配符，如 ['.git', '*.tmp']
+# workers > 1 时用线程池并发列出子目录，适合高延迟的网络文件系统
+def scan_folder(folder_path, suffix=None, exclude=(), subfolders=True, workers=8):
+    suffix = tuple(suffix) if isinstance(suffix, (list, set)) else suffix
+    if not subfolders or workers <= 1:
+        stack = [folder_path]
+        while stack:
+            files, subdirs = _scan_dir(stack.pop(), suffix, exclude)
+            yield from files
+            if subfolders:
+                stack.extend(subdirs)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_scan_dir, folder_path, suffix, exclude)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                for dir_path in subdirs:
+                    pending.add(executor.submit(_scan_dir, dir_path, suffix, exclude))
+                yield from files
+
+
+# 当前进程的 ScriptExporter，每个进程只导入一次 nbconvert
+_exporter = None
+
+
+# 进程池初始化函数：在工作进程启动时导入 nbconvert
+def _init_exporter():
+    global _exporter
+    from nbconvert import ScriptExporter
+    _exporter = ScriptExporter()
+
+
+# 转换单个 notebook，返回 (ipynb路径, py路径, 耗时, 错误信息)
+def _convert_notebook(file_path):
+    if _exporter is None:
+        _init_exporter()
+    start = time.perf_counter()
+    new_file_path = os.path.splitext(file_path)[0] + '.py'
+    try:
+        output, _ = _exporter.from_filename(file_path)
+        with open(new_file_path, 'w') as f:
+            f.write(output)
+    except Exception as e:
+        return file_path, new_file_path, time.perf_counter() - start, str(e)
+    return file_path, new_file_path, time.perf_counter() - start, None
+
+
+# 删除单个文件，返回错误信息（成功为 None）
+def _remove_file(file_path):
+    try:
+        os.remove(file_path)
+    except OSError as e:
+        return str(e)
+    return None
+
+
+# 部分哈希：只读取文件开头和结尾各 chunk_size 字节
+def _partial_hash(file_path, chunk_size=4096):
+    try:
+        with open(file_path, 'rb') as f:
+            digest = hashlib.blake2b(f.read(chunk_size))
+            if os.fstat(f.fileno()).st_size > chunk_size * 2:
+                f.seek(-chunk_size, os.SEEK_END)
+            digest.update(f.read(chunk_size))
+    except OSError as e:
+        print(f"无法读取 {file_path}：{e}")
+        return None
+    return digest.hexdigest()
+
+
+# 完整哈希：分块流式读取
+def _full_hash(file_path, block_size=1024 * 1024):
+    digest = hashlib.blake2b()
+    try:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+    except OSError as e:
+        print(f"无法读取 {file_path}：{e}")
+        return None
+    return digest.hexdigest()
+
+
+# 按哈希细分各组文件，只保留仍有重复的组（哈希在线程池中并行计算）
+def _split_groups(groups, hash_func, executor):
+    paths = [(index, file_path) for index, group in enumerate(groups) for file_path in group]
+    buckets = defaultdict(list)
+    for (index, file_path), digest in zip(paths, executor.map(hash_func, [p for _, p in paths])):
+        if digest is not None:
+            buckets[(index, digest)].append(file_path)
+    return [group for group in buckets.values() if len(group) > 1]
+
+
+class FolderIndex(object):
+    """
+    目录索引（SQLite），记录文件的路径、大小、修改时间，索引中的路径统一为绝对路径。
+    refresh 只重新列出修改时间变化的目录（新增、删除、重命名文件都会改变所在目录的mtime），
+    其余目录直接沿用索引中的子目录和文件；原地修改文件内容不会改变目录mtime，需要 verify=True 全量核对。
+    """
+
+    def __init__(self, folder_path, index_path='./folder_index.db'):
+        self.root = folder_path  # 调用方给出的形式，files 返回的路径以此开头，与 scan_folder 一致
+        self.folder_path = os.path.abspath(folder_path)
+        self.index_path = os.path.abspath(index_path)
+        self.conn = sqlite3.connect(self.index_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime INTEGER);")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime INTEGER);")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_dir ON files (dir);")
+        self.conn.commit()
+
+    # 索引中属于 folder_path 的行
+    def _under_root(self, table, column='path'):
+        prefix = os.path.join(self.folder_path, '')
+        return self.conn.execute(
+            f"SELECT * FROM {table} WHERE {column} = ? OR substr({column}, 1, ?) = ?;",
+            (self.folder_path, len(prefix), prefix)).fetchall()
+
+    # 增量刷新索引，返回 {'added': [...], 'changed': [...], 'removed': [...]}
+    # verify: 重新列出所有目录并核对每个文件的大小和mtime
+    def refresh(self, verify=False):
+        known_dirs = {path: mtime for path, _, mtime in self._under_root('dirs')}
+        seen_dirs = set()
+        added, changed, removed = [], [], []
+        stack = [self.folder_path]
+        while stack:
+            dir_path = stack.pop()
+            try:
+                dir_mtime = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+            seen_dirs.add(dir_path)
+            if not verify and known_dirs.get(dir_path) == dir_mtime:
+                # 目录未变化：子目录取自索引，不再列出
+                stack.extend(row[0] for row in self.conn.execute(
+                    "SELECT path FROM dirs WHERE parent = ?;", (dir_path,)))
+                continue
+
+            indexed = {path: (size, mtime) for path, size, mtime in self.conn.execute(
+                "SELECT path, size, mtime FROM files WHERE dir = ?;", (dir_path,))}
+            current = {}
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            self.conn.execute("INSERT OR IGNORE INTO dirs VALUES (?, ?, NULL);",
+                                              (entry.path, dir_path))
+                            stack.append(entry.path)
+                        elif entry.is_file() and entry.path != self.index_path:
+                            stat = entry.stat()
+                            current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError as e:
+                print(f"无法读取目录 {dir_path}：{e}")
+                continue
+
+            for path, info in current.items():
+                if path not in indexed:
+                    added.append(path)
+                elif indexed[path] != info:
+                    changed.append(path)
+            gone = [path for path in indexed if path not in current]
+            removed.extend(gone)
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?);",
+                                  [(path, dir_path, size, mtime) for path, (size, mtime) in current.items()])
+            self.conn.executemany("DELETE FROM files WHERE path = ?;", [(path,) for path in gone])
+            # 根目录同样记录父目录：同一索引文件中可能还有其上级目录的索引，需能从上级找到本目录
+            self.conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?);",
+                              (dir_path, os.path.dirname(dir_path), dir_mtime))
+
+        # 已不存在的目录：连同其中的文件一起移出索引
+        for dir_path in set(known_dirs) - seen_dirs:
+            gone = [row[0] for row in self.conn.execute("SELECT path FROM files WHERE dir = ?;", (dir_path,))]
+            removed.extend(gone)
+            self.conn.execute("DELETE FROM files WHERE dir = ?;", (dir_path,))
+            self.conn.execute("DELETE FROM dirs WHERE path = ?;", (dir_path,))
+        self.conn.commit()
+        return {'added': added, 'changed': changed, 'removed': removed}
+
+    # 索引中的文件列表（按路径排序），过滤规则与 scan_folder 相同，路径以构造时的 folder_path 开头
+    # suffix: 后缀或后缀列表；exclude: 文件名/目录名通配符，路径中任一层匹配即排除
+    def files(self, suffix=None, exclude=()):
+        suffix = tuple(suffix) if isinstance(suffix, (list, set)) else suffix
+        file_list = []
+        for path, _, _, _ in self._under_root('files'):
+            if suffix is not None and not path.endswith(suffix):
+                continue
+            rel_path = os.path.relpath(path, self.folder_path)
+            if exclude and any(fnmatch(name, pattern) for name in rel_path.split(os.sep) for pattern in exclude):
+                continue
+            file_list.append(os.path.join(self.root, rel_path))
+        return sorted(file_list)
+
+    def close(self):
+        self.conn.close()
+
+
 class FolderTool(object):
-    def __init__(self, folder_path, suffix, subfolders=False):
+    # index_path: 指定时使用 FolderIndex 增量扫描（仅 subfolders=True），变化记录在 self.index_changes
+    # exclude/workers: 扫描时排除的名称通配符与并发线程数，见 scan_folder
+    # lazy: 为 True 时不预先生成 file_list，用 iter_files 流式获取
+    def __init__(self, folder_path, suffix, subfolders=False, index_path=None, exclude=(), workers=8, lazy=False):
         self.folder_path = folder_path
-        self.suffix = suffix   # ['.ipynb', '.jpg', '.txt', ...]
+        self.suffix = tuple(suffix) if isinstance(suffix, list) else suffix   # ['.ipynb', '.jpg', '.txt', ...]
+        self.subfolders = subfolders
+        self.exclude = exclude
+        self.workers = workers
         self.file_list = []
-        if subfolders:
+        self.index_changes = None
+        if lazy:
+            return
+        if subfolders and index_path is not None:
+            self.index_folder(index_path)
+        elif subfolders:
             self.work_folder()
         else:
             self.list_folder()
 
-    # listdir
+    # 流式产出匹配的文件路径
+    def iter_files(self):
+        return scan_folder(self.folder_path, self.suffix, self.exclude, self.subfolders, self.workers)
+
+    # listdir（按路径排序，结果与扫描顺序无关）
     def list_folder(self):
-        for filename in os.listdir(self.folder_path):
-            if filename.endswith(self.suffix):
-                file_path = os.path.join(self.folder_path, filename)
-                self.file_list.append(file_path)
+        self.file_list.extend(sorted(scan_folder(self.folder_path, self.suffix, self.exclude, subfolders=False)))
 
-    # walk
+    # walk（并发扫描的产出顺序不固定，按路径排序后每次结果一致）
     def work_folder(self):
-        for dirpath, dirnames, filenames in os.walk(self.folder_path):
-            for filename in filenames:
-                if filename.endswith(self.suffix):
-                    file_path = os.path.join(dirpath, filename)
-                    self.file_list.append(file_path)
+        self.file_list.extend(sorted(scan_folder(self.folder_path, self.suffix, self.exclude, workers=self.workers)))
+
+    # 增量索引
+    def index_folder(self, index_path):
+        index = FolderIndex(self.folder_path, index_path)
+        self.index_changes = index.refresh()
+        self.file_list = index.files(self.suffix, self.exclude)
+        index.close()
 
     # ipynb 2 py
-    def ipynb2py(self):
-        from nbconvert import ScriptExporter
-        exporter = ScriptExporter()
+    # workers > 1 时用进程池并行转换，每个工作进程只导入一次 nbconvert
+    # skip_newer: 已存在且比 .ipynb 新的 .py 不再转换
+    # 返回 {'converted': [(路径, 耗时)], 'skipped': [路径], 'failed': [(路径, 错误)], 'seconds': 总耗时}
+    def ipynb2py(self, workers=1, skip_newer=True):
+        start = time.perf_counter()
+        summary = {'converted': [], 'skipped': [], 'failed': [], 'seconds': 0.0}
+        todo = []
         for file_path in self.file_list:
-            output, _ = exporter.from_filename(file_path)
             new_file_path = os.path.splitext(file_path)[0] + '.py'
-            with open(new_file_path, 'w') as f:
-                f.write(output)
+            if skip_newer and os.path.exists(new_file_path) \
+                    and os.path.getmtime(new_file_path) >= os.path.getmtime(file_path):
+                summary['skipped'].append(file_path)
+                continue
+            todo.append(file_path)
+
+        if workers > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_exporter) as executor:
+                self._collect_conversions(executor.map(_convert_notebook, todo, chunksize=8), summary)
+        else:
+            self._collect_conversions(map(_convert_notebook, todo), summary)
+
+        summary['seconds'] = time.perf_counter() - start
+        print(f"转换 {len(summary['converted'])} 个, 跳过 {len(summary['skipped'])} 个, "
+              f"失败 {len(summary['failed'])} 个, 耗时 {summary['seconds']:.1f}s")
+        return summary
+
+    @staticmethod
+    def _collect_conversions(results, summary):
+        for file_path, new_file_path, seconds, error in results:
+            if error is None:
+                summary['converted'].append((file_path, seconds))
                 print(f"已将 {file_path} 转换为 {os.path.basename(new_file_path)}")
+            else:
+                summary['failed'].append((file_path, error))
+                print(f"{file_path} 转换失败：{error}")
 
-    def delete_file(self):
+    # 批量删除 file_list 中的文件
+    # dry_run: 只统计将删除的文件数和总字节数，不删除
+    # workers: 并发删除的线程数；batch_size: 每删除一批打印一次进度
+    # remove_empty_dirs: 删除后清理因此变空的目录（不删除 folder_path 本身）
+    # 返回 {'count', 'bytes', 'deleted', 'failed': [(路径, 错误)]}
+    def delete_file(self, dry_run=False, workers=8, batch_size=1000, remove_empty_dirs=False):
+        result = {'count': len(self.file_list), 'bytes': 0, 'deleted': 0, 'failed': []}
+        if dry_run:
+            for file_path in self.file_list:
+                try:
+                    result['bytes'] += os.path.getsize(file_path)
+                except OSError as e:
+                    result['failed'].append((file_path, str(e)))
+            print(f"[dry-run] 将删除 {result['count']} 个文件，共 {result['bytes'] / 1024 / 1024:.1f} MB")
+            return result
+
+        start = time.perf_counter()
+        dirs = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i in range(0, len(self.file_list), batch_size):
+                batch = self.file_list[i:i + batch_size]
+                for file_path, error in zip(batch, executor.map(_remove_file, batch)):
+                    if error is None:
+                        result['deleted'] += 1
+                        dirs.add(os.path.dirname(file_path))
+                    else:
+                        result['failed'].append((file_path, error))
+                print(f"已删除 {result['deleted']}/{result['count']} 个文件，失败 {len(result['failed'])} 个")
+        if remove_empty_dirs:
+            self._remove_empty_dirs(dirs)
+        print(f"删除完成，耗时 {time.perf_counter() - start:.1f}s")
+        return result
+
+    # 查找内容重复的文件，返回重复文件组 [[路径, ...], ...]
+    # 依次按 文件大小 -> 头尾部分哈希 -> 完整哈希 分组，大小或部分哈希唯一的文件不会被完整读取
+    # partial_size: 部分哈希读取的头尾字节数；不超过 2 * partial_size 的文件部分哈希即完整内容
+    def find_duplicates(self, workers=8, partial_size=4096):
+        start = time.perf_counter()
+        by_size = defaultdict(list)
         for file_path in self.file_list:
-            os.remove(file_path)
-            print(f"已将 {file_path} 删除")
+            try:
+                by_size[os.path.getsize(file_path)].append(file_path)
+            except OSError as e:
+                print(f"无法读取 {file_path}：{e}")
+        groups = [group for group in by_size.values() if len(group) > 1]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            groups = _split_groups(groups, lambda p: _partial_hash(p, partial_size), executor)
+            small = [group for group in groups if os.path.getsize(group[0]) <= partial_size * 2]
+            large = [group for group in groups if os.path.getsize(group[0]) > partial_size * 2]
+            duplicates = small + _split_groups(large, _full_hash, executor)
+
+        wasted = sum(os.path.getsize(group[0]) * (len(group) - 1) for group in duplicates)
+        print(f"找到 {len(duplicates)} 组重复文件，可释放 {wasted / 1024 / 1024:.1f} MB，"
+              f"耗时 {time.perf_counter() - start:.1f}s")
+        return duplicates
+
+    # 由深到浅删除空目录，并向上清理变空的父目录
+    def _remove_empty_dirs(self, dirs):
+        root = os.path.abspath(self.folder_path)
+        for dir_path in sorted((os.path.abspath(d) for d in dirs), key=len, reverse=True):
+            while dir_path != root and dir_path.startswith(os.path.join(root, '')):
+                try:
+                    os.rmdir(dir_path)
+                except OSError:
+                    break
+                dir_path = os.path.dirname(dir_path)
 
 
 if __name__ == "__main__":
     folder_path = 'D:/PycharmProjects/Time-Series-Analysis'
     folder_tool = FolderTool(folder_path, '.py', subfolders=True)
-    # folder_tool.ipynb2py()
-    folder_tool.delete_file()
+    # FolderTool(folder_path, '.ipynb', subfolders=True).ipynb2py(workers=os.cpu_count())
+    folder_tool.delete_file(dry_run=True)
+    # folder_tool.delete_file(remove_empty_dirs=True)
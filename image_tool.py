@@ -5,36 +5,234 @@ import numpy as np
 Created on common image process
 @author: <LMM>
 """
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from folder_tool import FolderTool
 from PIL import Image
 
+# 批处理可用的操作
+BATCH_OPS = ('color2space', 'preprocess', 'preprocess_adaptive')
+
+# JPEG 解码时直接按 1/2、1/4、1/8 缩小（在DCT域完成，不解码全分辨率图像）
+_REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                  4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+# 预处理用的形态学核，只创建一次
+_KERNEL = np.ones((3, 3), np.uint8)
+
+
+# 在缩小后仍不小于目标尺寸的前提下，选择最大的解码缩小倍数
+def reduce_factor(src_size, dst_size):
+    for factor in (8, 4, 2):
+        if src_size[0] // factor >= dst_size[0] and src_size[1] // factor >= dst_size[1]:
+            return factor
+    return 1
+
+
+# 批处理工作函数：读取图像，依次执行操作链，结果按原子目录结构写入 folder_dst
+# reduce: 解码缩小倍数，见 ImageTool.read
+# 返回 (源路径, 输出路径, 耗时, 错误信息)
+def _run_chain(file_path, folder_src, folder_dst, ops, dst_format=None, reduce=1):
+    start = time.perf_counter()
+    dst_path = os.path.join(folder_dst, os.path.relpath(file_path, folder_src))
+    if dst_format is not None:
+        dst_path = os.path.splitext(dst_path)[0] + '.' + dst_format
+    try:
+        image = ImageTool.read(file_path, reduce=reduce)
+        if image is None:
+            raise IOError('无法读取图像')
+        for name, kwargs in ops:
+            image = getattr(ImageTool, name)(image, **kwargs)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        if not cv2.imwrite(dst_path, image):
+            raise IOError('无法写入图像')
+    except Exception as e:
+        return file_path, dst_path, time.perf_counter() - start, str(e)
+    return file_path, dst_path, time.perf_counter() - start, None
+
+
+class _PdfStreamWriter:
+    """
+    流式多页PDF写入：每页一个 DCTDecode(JPEG) 图像，逐页写入文件后即释放，不在内存中保留已写入的页面。
+    """
+
+    def __init__(self, pdf_path, resolution=100.0):
+        self.resolution = resolution
+        self.f = open(pdf_path, 'wb')
+        self.f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self.offsets = {}
+        self.pages = []
+        self.next_obj = 3  # 1: Catalog, 2: Pages（页面树在关闭时写入）
+
+    def _write_obj(self, num, body, stream=None):
+        self.offsets[num] = self.f.tell()
+        self.f.write(f'{num} 0 obj\n'.encode() + body)
+        if stream is not None:
+            self.f.write(b'\nstream\n' + stream + b'\nendstream')
+        self.f.write(b'\nendobj\n')
+
+    # 写入一页；jpeg_data 为完整JPEG文件内容，mode 为 'RGB' 或 'L'
+    def add_jpeg(self, jpeg_data, width, height, mode='RGB'):
+        image_obj, content_obj, page_obj = self.next_obj, self.next_obj + 1, self.next_obj + 2
+        self.next_obj += 3
+        color_space = '/DeviceGray' if mode == 'L' else '/DeviceRGB'
+        self._write_obj(image_obj, (
+            f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace {color_space} '
+            f'/BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg_data)} >>').encode(), jpeg_data)
+        page_width, page_height = width * 72.0 / self.resolution, height * 72.0 / self.resolution
+        content = f'q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q'.encode()
+        self._write_obj(content_obj, f'<< /Length {len(content)} >>'.encode(), content)
+        self._write_obj(page_obj, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] '
+            f'/Resources << /XObject << /Im0 {image_obj} 0 R >> >> /Contents {content_obj} 0 R >>').encode())
+        self.pages.append(page_obj)
+
+    def close(self):
+        kids = ' '.join(f'{num} 0 R' for num in self.pages)
+        self._write_obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+        self._write_obj(2, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>'.encode())
+        xref = self.f.tell()
+        self.f.write(f'xref\n0 {self.next_obj}\n0000000000 65535 f \n'.encode())
+        for num in range(1, self.next_obj):
+            self.f.write(f'{self.offsets[num]:010d} 00000 n \n'.encode())
+        self.f.write(f'trailer\n<< /Size {self.next_obj} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode())
+        self.f.close()
+
+
+class PreprocessEngine:
+    """
+    批量预处理引擎，结果与 ImageTool.preprocess / preprocess_adaptive 相同。
+    核只创建一次，按图像尺寸预分配灰度、二值化缓冲区，尺寸相同的连续图像间复用，膨胀和腐蚀合并为一次闭/开运算。
+    method: 'otsu' 对应 preprocess，'adaptive' 对应 preprocess_adaptive
+    """
+
+    def __init__(self, method='otsu', kernel_size=3, block_size=11, c=2):
+        if method not in ('otsu', 'adaptive'):
+            raise ValueError(f'preprocess method not supported: {method}')
+        self.method = method
+        self.block_size = block_size
+        self.c = c
+        self.kernel = np.ones((kernel_size, kernel_size), np.uint8)
+        self._shape = None  # 当前缓冲区对应的 (高, 宽)
+        self._buffers = None  # (灰度缓冲区, 二值化缓冲区)
+
+    # 只保留最近一种尺寸的缓冲区：尺寸各异的图像依次处理时内存不随尺寸种类增长
+    def _get_buffers(self, shape):
+        if shape != self._shape:
+            self._shape = shape
+            self._buffers = (np.empty(shape, np.uint8), np.empty(shape, np.uint8))
+        return self._buffers
+
+    # 处理单张图像（BGR 或灰度）
+    # dst: 输出数组，不指定时新建；多次调用复用同一个 dst 可避免每张图像分配内存
+    def process(self, src_image, dst=None):
+        shape = src_image.shape[:2]
+        gray, binary = self._get_buffers(shape)
+        if src_image.ndim == 3:
+            cv2.cvtColor(src_image, cv2.COLOR_BGR2GRAY, dst=gray)
+            src_image = gray
+        if dst is None:
+            dst = np.empty(shape, np.uint8)
+        if self.method == 'otsu':
+            cv2.threshold(src_image, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU, dst=binary)
+            cv2.morphologyEx(binary, cv2.MORPH_CLOSE, self.kernel, dst=dst)
+        else:
+            cv2.adaptiveThreshold(src_image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                  self.block_size, self.c, dst=binary)
+            cv2.morphologyEx(binary, cv2.MORPH_OPEN, self.kernel, dst=dst)
+        return dst
+
+    # 处理一批同尺寸图像：images 为 (N, 高, 宽[, 3]) 数组或同尺寸图像列表
+    # out: (N, 高, 宽) 输出数组，可在多批之间复用；数量不足或尺寸不符时重新分配，以返回值为准
+    def process_batch(self, images, out=None):
+        height, width = images[0].shape[:2]
+        if out is None or out.shape[0] < len(images) or out.shape[1:] != (height, width):
+            out = np.empty((len(images), height, width), np.uint8)
+        for i, image in enumerate(images):
+            self.process(image, dst=out[i])
+        return out[:len(images)]
+
 
 class ImageTool:
-    def __init__(self, folder_src, folder_dst, src_format="jpg"):
+    # index_path: 目录索引文件，指定时增量扫描 folder_src，见 FolderIndex
+    def __init__(self, folder_src, folder_dst, src_format="jpg", index_path=None):
         self.folder_src = folder_src
         self.folder_dst = folder_dst
-        self.image_list = FolderTool(self.folder_src, src_format, subfolders=True).file_list
+        self.image_list = FolderTool(self.folder_src, src_format, subfolders=True, index_path=index_path).file_list
 
-    def read(self, file_path):
+    @staticmethod
+    # reduce: 解码缩小倍数 1/2/4/8，JPEG 在解码阶段直接得到缩小后的图像
+    def read(file_path, reduce=1):
 
         try:
-            image = cv2.imread(file_path)
+            image = cv2.imread(file_path, _REDUCED_FLAGS[reduce])
             # print("图像读取成功！")
             return image
         except IOError:
             print("无法读取图像，请检查路径!")
 
-    def reshape2pdf(self, out_path, new_shape=(2000, 1500)):
+    # 读取并缩放到 new_shape (宽, 高)：先按最大可用倍数缩小解码，再 INTER_AREA 缩放到目标尺寸
+    @staticmethod
+    def read_resized(file_path, new_shape):
+        with Image.open(file_path) as image:
+            factor = reduce_factor(image.size, new_shape)
+        image = ImageTool.read(file_path, reduce=factor)
+        if image is None:
+            return None
+        return cv2.resize(image, new_shape, interpolation=cv2.INTER_AREA)
+
+    # single_pdf: 为 True 时所有图像流式写入一个多页PDF（out_path + '.pdf'），
+    #   chunk_size 指定时每 chunk_size 页一个文件（out_path + 序号 + '.pdf'）；否则每张图像一个PDF
+    # new_shape: 为 None 时不缩放，此时 RGB/灰度 JPEG 原样嵌入，不重新编码
+    # 页面与编号按图像路径排序
+    def reshape2pdf(self, out_path, new_shape=(2000, 1500), single_pdf=False, chunk_size=None, quality=90):
+        if single_pdf or chunk_size:
+            return self._reshape2pdf_stream(out_path, new_shape, chunk_size, quality)
 
         count = 0
-        for file in self.image_list:
+        for file in sorted(self.image_list):
             image = Image.open(file)
+            image.draft(image.mode, new_shape)  # JPEG 按DCT缩小解码，尺寸不小于 new_shape
             image = image.resize(new_shape)
             image.save(out_path + str(count) + '.pdf', "PDF", resolution=100.0)
             print(f"save {image} as pdf, count={count}")
             count += 1
 
-    def color2space(self, src_image, color_space='RGB'):
+    # 读取一页的JPEG数据，返回 (jpeg_data, width, height, mode)；无需缩放的 JPEG 直接读取原文件字节
+    @staticmethod
+    def _pdf_page(file, new_shape=None, quality=90):
+        with Image.open(file) as image:
+            if image.format == 'JPEG' and image.mode in ('RGB', 'L') and new_shape in (None, image.size):
+                with open(file, 'rb') as f:
+                    return f.read(), image.width, image.height, image.mode
+            if new_shape is not None:
+                image.draft(image.mode, new_shape)
+            image = image.convert('L' if image.mode in ('L', '1', 'I', 'F') else 'RGB')
+            if new_shape is not None:
+                image = image.resize(new_shape)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=quality)
+            return buffer.getvalue(), image.width, image.height, image.mode
+
+    def _reshape2pdf_stream(self, out_path, new_shape, chunk_size, quality):
+        writer, pdf_path = None, None
+        for count, file in enumerate(sorted(self.image_list)):
+            if writer is None or (chunk_size and count % chunk_size == 0):
+                if writer is not None:
+                    writer.close()
+                    print(f"save {len(writer.pages)} pages as {pdf_path}")
+                pdf_path = out_path + (str(count // chunk_size) if chunk_size else '') + '.pdf'
+                writer = _PdfStreamWriter(pdf_path, resolution=100.0)
+            writer.add_jpeg(*self._pdf_page(file, new_shape, quality))
+        if writer is not None:
+            writer.close()
+            print(f"save {len(writer.pages)} pages as {pdf_path}")
+
+    @staticmethod
+    def color2space(src_image, color_space='RGB'):
 
         if color_space == 'RGB':
             dst_image = cv2.cvtColor(src_image, cv2.COLOR_BGR2RGB)
@@ -51,28 +249,65 @@ class ImageTool:
 
         return dst_image
 
-    def preprocess(self, src_image):
+    @staticmethod
+    def preprocess(src_image):
         # 二值化
         dst_image = cv2.threshold(src_image, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
-        # 膨胀
-        kernel = np.ones((3, 3), np.uint8)
-        dst_image = cv2.dilate(dst_image, kernel, iterations=1)
-        # 腐蚀
-        dst_image = cv2.erode(dst_image, kernel, iterations=1)
+        # 先膨胀后腐蚀（闭运算），一次完成
+        dst_image = cv2.morphologyEx(dst_image, cv2.MORPH_CLOSE, _KERNEL)
 
         return dst_image
 
-    def preprocess_adaptive(self, src_image):
+    @staticmethod
+    def preprocess_adaptive(src_image):
         # 高斯模糊
         # blurred = cv2.GaussianBlur(img, (1, 1), 0)
-        # 灰度化
-        gray = cv2.cvtColor(src_image, cv2.COLOR_BGR2GRAY)
+        # 灰度化（已是灰度图则跳过）
+        gray = src_image if src_image.ndim == 2 else cv2.cvtColor(src_image, cv2.COLOR_BGR2GRAY)
         # 自适应阈值化
         thresholded = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
                                             cv2.THRESH_BINARY, 11, 2)
-        # 腐蚀和膨胀操作去除噪点
-        kernel = np.ones((3, 3), np.uint8)
-        eroded = cv2.erode(thresholded, kernel, iterations=1)
-        dilated = cv2.dilate(eroded, kernel, iterations=1)
+        # 先腐蚀后膨胀（开运算）去除噪点，一次完成
+        dilated = cv2.morphologyEx(thresholded, cv2.MORPH_OPEN, _KERNEL)
 
         return dilated
+
+    # 批量处理 image_list：每张图像在进程池中读取并执行操作链，结果写入 folder_dst
+    # ops: 操作链，元素为操作名或 (操作名, 参数字典)，如 [('color2space', {'color_space': 'GRAY'}), 'preprocess']
+    # max_in_flight: 同时在途的任务数上限（默认 2 * workers），内存占用不随图像数量增长
+    # dst_format: 输出格式（如 'png'），默认与源文件相同
+    # reduce: 解码缩小倍数 1/2/4/8，输出不需要全分辨率时可大幅减少解码时间
+    # 返回 {'done': 成功数, 'failed': [(路径, 错误)], 'seconds': 总耗时}
+    def batch_process(self, ops, workers=None, max_in_flight=None, dst_format=None, reduce=1):
+        ops = [(op, {}) if isinstance(op, str) else (op[0], dict(op[1])) for op in ops]
+        for name, _ in ops:
+            if name not in BATCH_OPS:
+                raise ValueError(f'operation not supported: {name}')
+        workers = workers or os.cpu_count()
+        max_in_flight = max_in_flight or workers * 2
+        result = {'done': 0, 'failed': [], 'seconds': 0.0}
+        start = time.perf_counter()
+
+        def collect(futures):
+            for future in futures:
+                file_path, _, _, error = future.result()
+                if error is None:
+                    result['done'] += 1
+                else:
+                    result['failed'].append((file_path, error))
+                    print(f"{file_path} 处理失败：{error}")
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for file_path in self.image_list:
+                pending.add(executor.submit(_run_chain, file_path, self.folder_src, self.folder_dst, ops,
+                                            dst_format, reduce))
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            collect(pending)
+
+        result['seconds'] = time.perf_counter() - start
+        print(f"处理完成 {result['done']}/{len(self.image_list)} 张，失败 {len(result['failed'])} 张，"
+              f"耗时 {result['seconds']:.1f}s")
+        return result
@@ -1,11 +1,22 @@
 # -*- coding: UTF-8 -*-
+import os
 import pytesseract
 from PIL import Image
-from pdf2image import convert_from_path
-import os
+from pdf2image import convert_from_path, pdfinfo_from_path
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from functools import partial
+import hashlib
+import re
+import sqlite3
+import time
+import unicodedata
+import warnings
 
-# 设置Tesseract OCR路径（如果需要）
-pytesseract.pytesseract.tesseract_cmd = r'D:/Tesseract-OCR/tesseract.exe'
+# 设置Tesseract OCR路径（如果需要），可用环境变量 TESSERACT_CMD 覆盖；路径不存在时使用 PATH 中的 tesseract
+TESSERACT_CMD = os.getenv('TESSERACT_CMD', r'D:/Tesseract-OCR/tesseract.exe')
+if os.path.exists(TESSERACT_CMD):
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
 
 
 # 将PDF转换为图像
@@ -14,39 +25,471 @@ def convert_pdf_to_images(pdf_path):
     return images
 
 
-# 对图像进行OCR处理
-def ocr_images(images):
-    text = ""
+# 将页码按窗口切分为连续区间 [(first, last), ...]
+def _page_windows(pages, window):
+    first = last = None
+    for page in sorted(pages):
+        if first is not None and page == last + 1 and page - first < window:
+            last = page
+            continue
+        if first is not None:
+            yield first, last
+        first = last = page
+    if first is not None:
+        yield first, last
+
+
+# 分窗口渲染PDF页面，逐页产出 (页码, 图像)
+# 每次只渲染 window 页，页面交给调用方后即释放，内存占用与总页数无关
+# pages: 需要渲染的页码（从1开始），默认全部页面
+def iter_pdf_images(pdf_path, dpi=200, window=4, pages=None):
+    if pages is None:
+        pages = range(1, pdfinfo_from_path(pdf_path)['Pages'] + 1)
+    for first, last in _page_windows(pages, window):
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last)
+        images.reverse()
+        for page in range(first, last + 1):
+            yield page, images.pop()
+
+
+# OCR前预处理：灰度化、按目标DPI缩小、二值化（复用 ImageTool 的预处理），全程在内存中完成
+# method: 'otsu' 对应 ImageTool.preprocess，'adaptive' 对应 ImageTool.preprocess_adaptive
+def preprocess_page(image, dpi=200, target_dpi=None, method='otsu'):
+    import cv2
+    import numpy as np
+    from image_tool import ImageTool
+
+    gray = np.asarray(image.convert('L'))
+    if target_dpi and target_dpi < dpi:
+        scale = target_dpi / dpi
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if method == 'adaptive':
+        return ImageTool.preprocess_adaptive(gray)
+    elif method == 'otsu':
+        return ImageTool.preprocess(gray)
+    else:
+        raise ValueError(f'preprocess method not supported: {method}')
+
+
+# OCR后端：'tesserocr' 通过C-API在进程内常驻Tesseract引擎，'pytesseract' 每页启动一次 tesseract 子进程
+# 'auto' 在安装了 tesserocr 时使用前者
+def resolve_backend(backend='auto'):
+    if backend != 'auto':
+        return backend
+    try:
+        import tesserocr  # noqa: F401
+        return 'tesserocr'
+    except ImportError:
+        return 'pytesseract'
+
+
+# 从 pytesseract 的 config 中解析页面分割模式，tesserocr 只支持 '--psm N'（或空配置）
+def _parse_psm(config):
+    tokens = config.split()
+    if not tokens:
+        return 3  # Tesseract 默认 PSM_AUTO
+    if len(tokens) == 2 and tokens[0] == '--psm' and tokens[1].isdigit():
+        return int(tokens[1])
+    return None
+
+
+# 本进程内常驻的 tesserocr 引擎 {(lang, psm): PyTessBaseAPI}，首次使用时加载语言模型，之后复用
+_tess_apis = {}
+
+
+def _tesserocr_api(lang, config):
+    psm = _parse_psm(config)
+    if psm is None:
+        raise ValueError(f'tesserocr backend only supports "--psm N" config, got: {config!r}')
+    key = (lang, psm)
+    if key not in _tess_apis:
+        from tesserocr import PyTessBaseAPI
+        tessdata = os.path.join(os.path.dirname(TESSERACT_CMD), 'tessdata')
+        kwargs = {'path': tessdata} if os.path.isdir(tessdata) else {}
+        _tess_apis[key] = PyTessBaseAPI(lang=lang, psm=psm, **kwargs)  # PSM 的取值即整数
+    return _tess_apis[key]
+
+
+# 单页OCR（进程池的工作函数，需定义在模块顶层以便序列化）
+# preprocess: 可选的预处理函数，在工作进程内执行
+# backend: 'tesserocr' 或 'pytesseract'，见 resolve_backend
+def _ocr_page(image, lang='chi_sim', config='', preprocess=None, backend='pytesseract'):
+    if preprocess is not None:
+        image = preprocess(image)
+    if backend == 'tesserocr':
+        api = _tesserocr_api(lang, config)
+        if not isinstance(image, Image.Image):
+            image = Image.fromarray(image)
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    return pytesseract.image_to_string(image, lang=lang, config=config)
+
+
+# 有界提交的有序 map：最多 max_in_flight 个任务在途，避免一次性读入全部输入
+def _imap_bounded(executor, fn, iterable, max_in_flight):
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# 逐页OCR，按页序产出每页文本
+# workers > 1 时按页分发到多个进程，在途页面数量受限，内存占用保持平稳
+# executor: 外部传入的进程池，多个文档共用时工作进程及其中常驻的OCR引擎不必重复创建
+# config 中有 '--psm N' 以外的参数时，'auto' 后端退回 pytesseract
+def iter_ocr(images, lang='chi_sim', workers=1, config='', preprocess=None, backend='auto', executor=None):
+    backend = resolve_backend(backend) if _parse_psm(config) is not None else 'pytesseract'
+    ocr_page = partial(_ocr_page, lang=lang, config=config, preprocess=preprocess, backend=backend)
+    if executor is not None:
+        yield from _imap_bounded(executor, ocr_page, images, max(workers, 1) * 2)
+        return
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from _imap_bounded(executor, ocr_page, images, workers * 2)
+        return
+
     for image in images:
-        image.show()
-        image_text = pytesseract.image_to_string(image, lang='chi_sim')
-        text += image_text
-    return text
+        yield ocr_page(image)
+
+
+# 对图像进行OCR处理，结果保持页序，最后一次性拼接
+def ocr_images(images, lang='chi_sim', workers=1, config='', preprocess=None, backend='auto'):
+    return "".join(iter_ocr(images, lang=lang, workers=workers, config=config, preprocess=preprocess,
+                            backend=backend))
+
+
+# 计算文件内容哈希（分块读取，不一次性载入大文件）
+def file_digest(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# OCR引擎标识：后端、语言、配置、预处理或Tesseract版本变化后，旧的缓存结果不再命中
+def ocr_engine_signature(lang='chi_sim', config='', preprocess=None, target_dpi=None, backend='auto'):
+    backend = resolve_backend(backend) if _parse_psm(config) is not None else 'pytesseract'
+    if backend == 'tesserocr':
+        import tesserocr
+        version = tesserocr.tesseract_version().split()[1]
+    else:
+        version = pytesseract.get_tesseract_version()
+    return f"{backend} {version}|{lang}|{config}|{preprocess}@{target_dpi}"
+
+
+class OCRCache:
+    """
+    OCR结果磁盘缓存（SQLite），以 PDF内容哈希 + 页码 + DPI + OCR引擎标识 为键。
+    总大小超过 max_bytes 时按最近访问时间（LRU）淘汰。
+    """
+
+    def __init__(self, cache_path='./pdf2txt/ocr_cache.db', max_bytes=256 * 1024 * 1024):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(cache_path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ocr (
+                doc TEXT, page INTEGER, dpi INTEGER, engine TEXT,
+                text TEXT, size INTEGER, atime REAL,
+                PRIMARY KEY (doc, page, dpi, engine));""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ocr_atime ON ocr (atime);")
+        self.conn.commit()
 
+    # 取出某文档已缓存的全部页面 {页码: 文本}，并刷新访问时间
+    def get_pages(self, doc, dpi, engine):
+        records = self.conn.execute(
+            "SELECT page, text FROM ocr WHERE doc = ? AND dpi = ? AND engine = ?;",
+            (doc, dpi, engine)).fetchall()
+        if records:
+            self.conn.execute(
+                "UPDATE ocr SET atime = ? WHERE doc = ? AND dpi = ? AND engine = ?;",
+                (time.time(), doc, dpi, engine))
+            self.conn.commit()
+        return dict(records)
 
-# 提取文本中的特定信息（示例）
-def extract_information(text):
-    # 这里可以使用正则表达式或其他方法来提取特定信息
-    # 例如，提取所有以"Hello"开头的行
-    lines = text.split('\n')
-    hello_lines = [line for line in lines if line.startswith('Hello')]
-    print(hello_lines)
-    return hello_lines
+    def put(self, doc, page, dpi, engine, text):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?, ?, ?, ?);",
+            (doc, page, dpi, engine, text, len(text.encode('utf-8')), time.time()))
+        self.conn.commit()
+
+    # 按LRU淘汰，直到总大小不超过 max_bytes
+    def evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr;").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        expired = []
+        for key in self.conn.execute("SELECT doc, page, dpi, engine, size FROM ocr ORDER BY atime;"):
+            expired.append(key[:4])
+            total -= key[4]
+            if total <= self.max_bytes:
+                break
+        self.conn.executemany(
+            "DELETE FROM ocr WHERE doc = ? AND page = ? AND dpi = ? AND engine = ?;", expired)
+        self.conn.commit()
+
+    # 使缓存失效：指定 engine 时只删除该引擎标识的结果，否则清空
+    def invalidate(self, engine=None):
+        if engine is None:
+            self.conn.execute("DELETE FROM ocr;")
+        else:
+            self.conn.execute("DELETE FROM ocr WHERE engine = ?;", (engine,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# 判断文本层是否可用：有效字符足够多，且乱码（替换字符、控制字符）比例很低
+# 扫描件常带有水印等少量文字，min_chars 用于把这类页面仍交给OCR
+def _usable_text(text, min_chars=50):
+    chars = ''.join(text.split())
+    if len(chars) < min_chars:
+        return False
+    bad = sum(1 for char in chars if char == '\ufffd' or unicodedata.category(char).startswith('C'))
+    return bad / len(chars) < 0.05
+
+
+# 提取PDF自带的文本层，返回 {页码: 文本}，只包含文本可用的页面（扫描页不在其中）
+# 未安装 pypdf 时给出警告并返回空字典，所有页面走OCR
+def extract_text_layer(pdf_path, min_chars=50):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        warnings.warn('pypdf 未安装，不读取PDF文本层，全部页面OCR（pip install pypdf）')
+        return {}
+    reader = PdfReader(pdf_path)
+    texts = {}
+    for page_number, page in enumerate(reader.pages, start=1):
+        try:
+            text = page.extract_text() or ''
+        except Exception as e:
+            print(f"第 {page_number} 页文本层提取失败：{e}")
+            continue
+        if _usable_text(text, min_chars):
+            texts[page_number] = text + '\n'
+    return texts
+
+
+# 逐页产出PDF文本（保持页序）
+# text_layer: 先读取PDF自带文本层，只有纯图像页面才渲染并OCR
+# cache: OCRCache 实例，已缓存的页面既不渲染也不OCR
+# preprocess/target_dpi: OCR前的预处理方式（'otsu'/'adaptive'）与缩小到的DPI，见 preprocess_page
+# backend/executor: OCR后端与共用的进程池，见 iter_ocr
+def iter_pdf_text(pdf_path, lang='chi_sim', workers=1, dpi=200, window=4, config='', cache=None,
+                  text_layer=True, preprocess=None, target_dpi=None, backend='auto', executor=None):
+    pages = range(1, pdfinfo_from_path(pdf_path)['Pages'] + 1)
+    native = extract_text_layer(pdf_path) if text_layer else {}
+
+    cached = {}
+    if cache is not None:
+        doc = file_digest(pdf_path)
+        engine = ocr_engine_signature(lang, config, preprocess, target_dpi, backend)
+        cached = cache.get_pages(doc, dpi, engine)
+
+    missing = [page for page in pages if page not in native and page not in cached]
+    images = (image for _, image in iter_pdf_images(pdf_path, dpi=dpi, window=window, pages=missing))
+    page_preprocess = None
+    if preprocess is not None:
+        page_preprocess = partial(preprocess_page, dpi=dpi, target_dpi=target_dpi, method=preprocess)
+    texts = iter_ocr(images, lang=lang, workers=workers, config=config, preprocess=page_preprocess,
+                     backend=backend, executor=executor)
+    for page in pages:
+        if page in native:
+            yield native[page]
+        elif page in cached:
+            yield cached[page]
+        else:
+            text = next(texts)
+            if cache is not None:
+                cache.put(doc, page, dpi, engine, text)
+            yield text
+    if cache is not None:
+        cache.evict()
+
+
+# 未带内联标志的正则的默认 flags，用于识别规则中的 (?i) 等全局标志
+_DEFAULT_FLAGS = re.compile('').flags
+
+# str.splitlines 视为行边界的字符（含OCR分页符 \f）
+_LINE_BREAKS = '\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+
+
+class ExtractRules:
+    """
+    信息提取规则引擎：多条规则编译为一个组合正则，对流式文本逐行只匹配一次。
+    rules: {规则名: 正则}；keywords: {规则名: [关键词, ...]}，关键词按字面量匹配。
+    含捕获组、反向引用或全局内联标志（如 (?i)）的规则放入组合正则会改变其含义，这些规则单独匹配。
+    一行同时满足多条规则时，归入匹配位置最靠前的规则，位置相同时归入先定义的规则。
+    """
+
+    def __init__(self, rules=None, keywords=None):
+        self.names = []
+        combined = []
+        self.separate = []  # [(规则序号, 单独编译的正则)]
+        for name, pattern in (rules or {}).items():
+            compiled = re.compile(pattern)  # 单独编译一次，规则写错时报出具体是哪条
+            if compiled.groups or compiled.flags != _DEFAULT_FLAGS:
+                self.separate.append((len(self.names), compiled))
+            else:
+                combined.append((len(self.names), pattern))
+            self.names.append(name)
+        for name, words in (keywords or {}).items():
+            # 长词优先，避免被其前缀抢先匹配；空词会匹配任意行，忽略
+            words = sorted({word for word in words if word}, key=len, reverse=True)
+            if not words:
+                raise ValueError(f'keyword rule {name!r} has no non-empty keywords')
+            combined.append((len(self.names), '|'.join(re.escape(word) for word in words)))
+            self.names.append(name)
+        if not self.names:
+            raise ValueError('at least one rule or keyword is required')
+        self.matcher = None
+        if combined:
+            self.matcher = re.compile('|'.join(f'(?P<_r{i}>{pattern})' for i, pattern in combined))
+
+    # 匹配单行，返回规则名，未命中返回 None
+    def match(self, line):
+        best = None  # (匹配位置, 规则序号)
+        if self.matcher is not None:
+            m = self.matcher.search(line)
+            if m is not None:
+                best = (m.start(), int(m.lastgroup[2:]))
+        for index, pattern in self.separate:
+            m = pattern.search(line)
+            if m is not None and (best is None or (m.start(), index) < best):
+                best = (m.start(), index)
+        if best is None:
+            return None
+        return self.names[best[1]]
+
+    # 对文本块流（如逐页OCR结果）逐行匹配，产出 (规则名, 行)
+    # 跨块的半行会缓存到下一块再匹配
+    def scan(self, chunks):
+        tail = ''
+        for chunk in chunks:
+            chunk = tail + chunk
+            lines = chunk.splitlines()
+            tail = ''
+            if lines and chunk[-1] not in _LINE_BREAKS:
+                tail = lines.pop()
+            for line in lines:
+                name = self.match(line)
+                if name is not None:
+                    yield name, line
+        if tail:
+            name = self.match(tail)
+            if name is not None:
+                yield name, tail
+
+
+# 默认规则（示例）：提取所有以"Hello"开头的行
+DEFAULT_RULES = ExtractRules({'hello': '^Hello'})
+
+
+# 提取文本中的特定信息
+# text: 完整文本，或逐页文本的可迭代对象（流式匹配，不拼接整篇文本）
+# rules: ExtractRules 实例，默认 DEFAULT_RULES
+def extract_information(text, rules=None):
+    rules = rules or DEFAULT_RULES
+    chunks = [text] if isinstance(text, str) else text
+    lines = [line for _, line in rules.scan(chunks)]
+    print(lines)
+    return lines
 
 
 # 主函数
-def process_pdf(pdf_path):
-    images = convert_pdf_to_images(pdf_path)
-    text = ocr_images(images)
-    information = extract_information(text)
+# rules: ExtractRules 实例，逐页文本产出后立即匹配
+# kwargs: 传给 iter_pdf_text，例如
+#   workers: OCR进程数，默认1为单进程；可设为 os.cpu_count()
+#   dpi/window: 渲染分辨率与每次渲染的页数
+#   cache: OCRCache 实例，重复处理同一PDF时跳过已OCR的页面
+#   text_layer: 有文本层的页面直接取文本，不做OCR
+#   preprocess/target_dpi: OCR前预处理
+def process_pdf(pdf_path, rules=None, **kwargs):
+    texts = iter_pdf_text(pdf_path, **kwargs)
+    information = extract_information(texts, rules=rules)
     return information
 
 
-# 示例用法
-pdf_file = './pdf2txt/GBT2900.20-2016.pdf'
-extracted_info = process_pdf(pdf_file)
-# for info in extracted_info:
-#     print(info)
-# text = pytesseract.image_to_string('./pdf2txt/test.jpg', lang='chi_sim')
-# information = extract_information(text)
-# print(text)
+# 单个PDF转为文本文件，逐页写入，返回页数
+def pdf_to_txt(pdf_path, txt_path, **kwargs):
+    pages = 0
+    with open(txt_path, 'w', encoding='utf-8') as f:
+        for text in iter_pdf_text(pdf_path, **kwargs):
+            f.write(text)
+            pages += 1
+    return pages
+
+
+# 批量处理文件夹中的PDF（无界面输出），每个PDF输出一个同名 .txt，保持子目录结构
+# folder_dst: 输出目录，默认与PDF放在一起
+# workers: OCR进程数，进程池在所有文档间共用
+# kwargs: 传给 iter_pdf_text
+# 返回每个文档的处理报告 [{'pdf', 'txt', 'pages', 'seconds', 'error'}, ...]
+def process_folder(folder_src, folder_dst=None, subfolders=True, workers=1, **kwargs):
+    from folder_tool import FolderTool
+    pdf_list = sorted(FolderTool(folder_src, ('.pdf', '.PDF'), subfolders=subfolders).file_list)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return _process_folder(pdf_list, folder_src, folder_dst, workers=workers, executor=executor, **kwargs)
+    return _process_folder(pdf_list, folder_src, folder_dst, **kwargs)
+
+
+def _process_folder(pdf_list, folder_src, folder_dst, **kwargs):
+    report = []
+    start_all = time.perf_counter()
+    for count, pdf_path in enumerate(pdf_list, start=1):
+        txt_path = os.path.splitext(pdf_path)[0] + '.txt'
+        if folder_dst is not None:
+            txt_path = os.path.join(folder_dst, os.path.relpath(txt_path, folder_src))
+            os.makedirs(os.path.dirname(txt_path), exist_ok=True)
+        start = time.perf_counter()
+        pages, error = 0, None
+        try:
+            pages = pdf_to_txt(pdf_path, txt_path, **kwargs)
+        except Exception as e:
+            error = str(e)
+        seconds = time.perf_counter() - start
+        report.append({'pdf': pdf_path, 'txt': txt_path, 'pages': pages, 'seconds': seconds, 'error': error})
+        if error is None:
+            print(f"[{count}/{len(pdf_list)}] {pdf_path}: {pages} 页, {seconds:.1f}s -> {txt_path}")
+        else:
+            print(f"[{count}/{len(pdf_list)}] {pdf_path}: 处理失败：{error}")
+    print(f"共处理 {len(pdf_list)} 个PDF, 耗时 {time.perf_counter() - start_all:.1f}s")
+    return report
+
+
+# 命令行批处理（多进程在Windows下以spawn方式启动子进程，入口须放在 __main__ 中）
+# 例如：python pdf2txt.py ./pdf2txt -o ./pdf2txt_out --workers 8 --cache ./pdf2txt/ocr_cache.db
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='PDF 批量转文本（文本层优先，其余页面OCR）')
+    parser.add_argument('folder_src', nargs='?', default='./pdf2txt/', help='PDF 所在目录')
+    parser.add_argument('-o', '--folder-dst', default=None, help='输出目录，默认与PDF同目录')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='OCR进程数')
+    parser.add_argument('--lang', default='chi_sim')
+    parser.add_argument('--dpi', type=int, default=200)
+    parser.add_argument('--preprocess', choices=['otsu', 'adaptive'], default=None)
+    parser.add_argument('--target-dpi', type=int, default=None)
+    parser.add_argument('--backend', choices=['auto', 'tesserocr', 'pytesseract'], default='auto')
+    parser.add_argument('--cache', default=None, help='OCR缓存文件路径，不指定则不使用缓存')
+    parser.add_argument('--no-text-layer', action='store_true', help='忽略PDF文本层，全部页面OCR')
+    parser.add_argument('--no-subfolders', action='store_true', help='不处理子目录')
+    args = parser.parse_args()
+
+    ocr_cache = OCRCache(args.cache) if args.cache else None
+    process_folder(args.folder_src, args.folder_dst, subfolders=not args.no_subfolders,
+                   workers=args.workers, lang=args.lang, dpi=args.dpi, cache=ocr_cache,
+                   text_layer=not args.no_text_layer, preprocess=args.preprocess, target_dpi=args.target_dpi,
+                   backend=args.backend)
+    if ocr_cache is not None:
+        ocr_cache.close()
+    # extracted_info = process_pdf('./pdf2txt/GBT2900.20-2016.pdf', workers=os.cpu_count())
+    # text = pytesseract.image_to_string('./pdf2txt/test.jpg', lang='chi_sim')
+    # information = extract_information(text)
+    # print(text)
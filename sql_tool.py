@@ -1,6 +1,12 @@
 # -*- coding: UTF-8 -*-
 
+import threading
+import uuid
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.pool
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN
 
 
 class SQLTool:
@@ -11,6 +17,10 @@ class SQLTool:
         self.user = user
         self.password = password
         self.conn = None
+        self.pool = None
+        self.health_check = True
+        self.maxconn = 0
+        self.slots = None  # 连接池名额，取连接的线程超过 maxconn 时排队等待
 
     def connect_to_db(self):
         # 连接到 PostgreSQL 数据库
@@ -24,27 +34,124 @@ class SQLTool:
             print(f"连接失败：{e}")
         return conn
 
+    def connect_pool(self, minconn=1, maxconn=8, health_check=True):
+        # 创建线程安全的连接池，多个线程可同时查询，连接复用不必重复建立
+        # health_check: 取出连接时先检查是否可用，断开的连接会被丢弃并重新获取
+        # 同时取用连接的线程超过 maxconn 时，多出的线程在 connection() 中等待，而不是由连接池抛出 PoolError
+        try:
+            self.pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, host=self.host, port=self.port,
+                                                             database=self.database, user=self.user,
+                                                             password=self.password)
+            self.health_check = health_check
+            self.maxconn = maxconn
+            self.slots = threading.BoundedSemaphore(maxconn)
+            print("连接池创建成功")
+        except Exception as e:
+            print(f"连接池创建失败：{e}")
+        return self.pool
+
+    @staticmethod
+    def _is_alive(conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1;')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @contextmanager
+    def connection(self):
+        # 取得一个连接：使用连接池时从池中取出，正常结束提交、异常回滚，用完放回；否则使用 connect_to_db 的单个连接
+        if self.pool is None:
+            yield self.conn
+            return
+
+        with self.slots:
+            conn = self._getconn()
+            broken = False
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                # 按连接状态判断是否断开：语句超时、取消（QueryCanceledError）的连接仍可用，回滚后放回池中
+                broken = self._is_broken(conn)
+                if not broken:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        broken = True
+                raise
+            finally:
+                self.pool.putconn(conn, close=broken or self._is_broken(conn))
+
+    @staticmethod
+    def _is_broken(conn):
+        return bool(conn.closed) or conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN
+
+    def _getconn(self):
+        # 从池中取出可用的连接：数据库重启后池中的空闲连接可能都已断开，逐个丢弃，
+        # 空闲连接耗尽后连接池会新建连接；新建的连接仍不可用时报错
+        for _ in range(self.maxconn + 1):
+            conn = self.pool.getconn()
+            if not self.health_check or self._is_alive(conn):
+                return conn
+            self.pool.putconn(conn, close=True)
+        raise psycopg2.OperationalError('连接池中没有可用的连接')
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.closeall()
+            self.pool = None
+            self.slots = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
     def execute_sql_file(self, file_path):
 
-        cursor = self.conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
 
-        with open(file_path, 'r') as file:
-            sql = file.read()
-        cursor.execute(sql)  # 执行SQL文件中的所有语句
+            with open(file_path, 'r') as file:
+                sql = file.read()
+            cursor.execute(sql)  # 执行SQL文件中的所有语句
 
-        cursor.close()
+            cursor.close()
 
     def analyze_data(self, query):
 
-        cursor = self.conn.cursor()
+        with self.connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute(query)
-        records = cursor.fetchall()
+            cursor.execute(query)
+            records = cursor.fetchall()
 
-        cursor.close()
+            cursor.close()
 
         return records
 
+    def iter_query(self, query, itersize=2000, chunk_size=None):
+        # 服务端（命名）游标流式查询，每次从服务器取 itersize 行，内存占用与结果集大小无关
+        # chunk_size: 为 None 时逐行产出，否则每次产出 chunk_size 行的列表
+        with self.connection() as conn:
+            cursor = conn.cursor(name=f"sqltool_{uuid.uuid4().hex}")
+            cursor.itersize = itersize
+            try:
+                cursor.execute(query)
+                if chunk_size is None:
+                    yield from cursor
+                else:
+                    while True:
+                        rows = cursor.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        yield rows
+            finally:
+                cursor.close()
+
     def get_column_names(self, table_name):
 
             query = f"SELECT column_name FROM information_schema.columns WHERE table_name = '{table_name}';"
@@ -90,6 +197,13 @@ class SQLTool:
 
     def get_property_specific_value(self, table, column, value, property=None, order_by=None, limit=None):
 
+        return [list(record) for record in self.iter_property_specific_value(table, column, value, property,
+                                                                             order_by, limit)]
+
+    def iter_property_specific_value(self, table, column, value, property=None, order_by=None, limit=None,
+                                     itersize=2000):
+        # 同 get_property_specific_value，以服务端游标逐行产出 (id, collect_time, property)
+
         query = f"SELECT * FROM {table} WHERE {column} = {value};"
 
         if property is not None:
@@ -100,13 +214,8 @@ class SQLTool:
         elif limit is not None:
             query = f"SELECT * FROM {table} WHERE {column} = {value} LIMIT 10;"
 
-        records = self.analyze_data(query)
-
-        property_list = []
-        for id, collect_time, prop in records:
-            property_list.append([id, collect_time, prop])
-
-        return property_list
+        for id, collect_time, prop in self.iter_query(query, itersize=itersize):
+            yield id, collect_time, prop
 
 
 if __name__ == "__main__":
@@ -144,3 +253,14 @@ if __name__ == "__main__":
         # db.execute_sql_file(sql_file_path)
 
         conn.close()
+
+    # 大表流式读取：每次处理 10000 行
+    # for rows in db.iter_query('SELECT * FROM eemstsmx.ts_g_gas;', itersize=10000, chunk_size=10000):
+    #     print(len(rows))
+
+    # 连接池：多个线程并行查询
+    # from concurrent.futures import ThreadPoolExecutor
+    # db.connect_pool(minconn=1, maxconn=8)
+    # with ThreadPoolExecutor(max_workers=8) as executor:
+    #     counts = list(executor.map(lambda t: db.get_column_counts(t, 'id'), ['ts_g_gas', 'ts_g_water']))
+    # db.close()
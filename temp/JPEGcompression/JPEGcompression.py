@@ -1,20 +1,194 @@
-from PIL import Image
+# -*- coding: UTF-8 -*-
+import io
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
 
-# 打开图像文件
-image = Image.open('jxj2018.jpg')
-#
-# 降低图像质量
-# image.save('by_low_quality.jpg', quality=80)
+# 批量压缩支持的源图像格式
+SRC_SUFFIX = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
 
 
+# 编码为JPEG，返回字节数据
+def _encode(image, quality, **save_kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality, optimize=True, **save_kwargs)
+    return buffer.getvalue()
 
-# 调整图像尺寸
-new_size = (image.size[0]//2, image.size[1]//2)
-resized_image = image.resize(new_size)
 
-# 保存图像
-# resized_image.save('resized_image.jpg')
+# 在内存中二分查找不超过 target_bytes 的最高质量，返回 (数据, 质量)
+# 最低质量仍超出时返回最低质量的结果，调用方据数据大小判断是否满足
+def _search_quality(image, target_bytes, min_quality=20, max_quality=95, **save_kwargs):
+    # 先试两端：最高质量已满足则直接返回，最低质量仍超出则不必再搜索
+    data = _encode(image, max_quality, **save_kwargs)
+    if len(data) <= target_bytes or min_quality >= max_quality:
+        return data, max_quality
+    best = (_encode(image, min_quality, **save_kwargs), min_quality)
+    if len(best[0]) > target_bytes:
+        return best
+    low, high = min_quality + 1, max_quality - 1
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(image, quality, **save_kwargs)
+        if len(data) <= target_bytes:
+            best = (data, quality)
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best
 
 
-# 使用压缩算法保存图像
-resized_image.save('jxj2018_compressed_image.jpg', optimize=True, compress_level=5)
\ No newline at end of file
+# 按字节预算编码JPEG，全程在内存中完成，返回 (数据, 质量, 缩放比例)
+# 依次尝试 scales 中的缩放比例，每个比例下二分查找满足预算的最高质量；缩放都基于同一份已解码的像素
+# 所有比例都无法满足时，返回最后一个比例、最低质量的结果；max_quality 低于 min_quality 时以 max_quality 为准
+def encode_to_size(image, max_bytes, min_quality=20, max_quality=95, scales=(1.0, 0.85, 0.7, 0.5), **save_kwargs):
+    if not scales:
+        raise ValueError('scales must contain at least one scale')
+    min_quality = min(min_quality, max_quality)
+    image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    for scale in scales:
+        scaled = image
+        if scale != 1.0:
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            scaled = image.resize(size, Image.LANCZOS)
+        data, quality = _search_quality(scaled, max_bytes, min_quality, max_quality, **save_kwargs)
+        if len(data) <= max_bytes:
+            break
+    return data, quality, scale
+
+
+# 读取图片（只解码一次）并按字节预算编码，返回 (数据, 质量, 缩放比例)，不写文件
+def compress_to_bytes(src_path, max_bytes, **kwargs):
+    with Image.open(src_path) as image:
+        image = ImageOps.exif_transpose(image)
+        return encode_to_size(image, max_bytes, **kwargs)
+
+
+# 压缩单张图片
+# quality: JPEG质量（target_bytes 指定时为质量上限）
+# max_dim: 长边最大像素，超过时等比缩小
+# target_bytes: 目标文件大小，二分查找满足该大小的最高质量，见 encode_to_size
+# scales: target_bytes 指定时可尝试的缩放比例，默认只在原尺寸下调整质量
+# keep_metadata: 保留 EXIF/ICC；不保留时先按 EXIF 方向旋转图像，避免去掉方向信息后显示错误
+# 未缩小尺寸且重新编码后不比原文件小时，保留原文件字节（沿用原扩展名），dst 与 kept 记录实际结果
+# 返回 {'src', 'dst', 'src_bytes', 'dst_bytes', 'quality', 'scale', 'kept', 'seconds', 'error'}
+def compress_image(src_path, dst_path, quality=85, max_dim=None, target_bytes=None, keep_metadata=False,
+                   scales=(1.0,)):
+    start = time.perf_counter()
+    result = {'src': src_path, 'dst': dst_path, 'src_bytes': os.path.getsize(src_path), 'dst_bytes': 0,
+              'quality': None, 'scale': 1.0, 'kept': False, 'seconds': 0.0, 'error': None}
+    try:
+        with Image.open(src_path) as image:
+            src_size = image.size
+            save_kwargs = {}
+            if keep_metadata:
+                for key in ('exif', 'icc_profile'):
+                    if image.info.get(key):
+                        save_kwargs[key] = image.info[key]
+            if max_dim:
+                image.thumbnail((max_dim, max_dim), Image.LANCZOS)  # 对JPEG会先按DCT缩小解码
+            resized = image.size != src_size
+            if not keep_metadata:
+                image = ImageOps.exif_transpose(image)
+
+            if target_bytes:
+                data, result['quality'], result['scale'] = encode_to_size(
+                    image, target_bytes, max_quality=quality, scales=scales, **save_kwargs)
+            else:
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                data, result['quality'] = _encode(image, quality, **save_kwargs), quality
+
+        os.makedirs(os.path.dirname(os.path.abspath(dst_path)), exist_ok=True)
+        if not resized and result['scale'] == 1.0 and len(data) >= result['src_bytes']:
+            dst_path = os.path.splitext(dst_path)[0] + os.path.splitext(src_path)[1]
+            if os.path.abspath(dst_path) != os.path.abspath(src_path):
+                shutil.copyfile(src_path, dst_path)
+            result.update(dst=dst_path, dst_bytes=result['src_bytes'], quality=None, kept=True)
+        else:
+            with open(dst_path, 'wb') as f:
+                f.write(data)
+            result['dst_bytes'] = len(data)
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+# 进程池工作函数
+def _compress_task(args):
+    src_path, dst_path, kwargs = args
+    return compress_image(src_path, dst_path, **kwargs)
+
+
+# 批量压缩 folder_src 中的图片，按原目录结构输出到 folder_dst（扩展名统一为 .jpg）
+# 同目录下同名不同格式的图片（如 a.jpg 与 a.png）会输出到同一文件名，此时后者改名为 a_png.jpg
+# workers: 进程数，默认CPU核数；kwargs: 传给 compress_image
+# 返回每个文件的压缩结果列表
+def compress_folder(folder_src, folder_dst, workers=None, **kwargs):
+    start = time.perf_counter()
+    tasks = []
+    claimed = set()  # 已分配的输出路径（不区分大小写，兼容 Windows）
+    for dirpath, dirnames, filenames in os.walk(folder_src):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(SRC_SUFFIX):
+                src_path = os.path.join(dirpath, filename)
+                stem, ext = os.path.splitext(os.path.relpath(src_path, folder_src))
+                rel_path = stem + '.jpg'
+                if rel_path.lower() in claimed:
+                    rel_path = f"{stem}_{ext[1:]}.jpg"
+                    if rel_path.lower() in claimed:
+                        print(f"{src_path}: 输出文件名冲突，跳过")
+                        continue
+                    print(f"{src_path}: 输出文件名冲突，改为 {rel_path}")
+                claimed.add(rel_path.lower())
+                tasks.append((src_path, os.path.join(folder_dst, rel_path), kwargs))
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for result in executor.map(_compress_task, tasks, chunksize=4):
+            results.append(result)
+            if result['kept']:
+                print(f"{result['src']}: 重新编码不会变小，保留原文件 -> {result['dst']}")
+            elif result['error'] is None:
+                saved = result['src_bytes'] - result['dst_bytes']
+                print(f"{result['src']}: {result['src_bytes'] / 1024:.0f}KB -> {result['dst_bytes'] / 1024:.0f}KB "
+                      f"(质量 {result['quality']}, 缩放 {result['scale']}, 节省 {saved / 1024:.0f}KB)")
+            else:
+                print(f"{result['src']}: 压缩失败：{result['error']}")
+
+    done = [result for result in results if result['error'] is None]
+    src_total = sum(result['src_bytes'] for result in done)
+    dst_total = sum(result['dst_bytes'] for result in done)
+    print(f"共压缩 {len(done)}/{len(results)} 张，{src_total / 1024 / 1024:.1f}MB -> {dst_total / 1024 / 1024:.1f}MB，"
+          f"耗时 {time.perf_counter() - start:.1f}s")
+    return results
+
+
+# 例如：python JPEGcompression.py ./photos ./photos_small --max-dim 2000 --target-bytes 500000
+#      单张：compress_image('jxj2018.jpg', 'jxj2018_compressed_image.jpg', max_dim=1600)
+#      内存中按预算编码：data, quality, scale = compress_to_bytes('xw.jpg', 200 * 1024)
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='JPEG 批量压缩')
+    parser.add_argument('folder_src', help='源图片目录')
+    parser.add_argument('folder_dst', help='输出目录')
+    parser.add_argument('--quality', type=int, default=85, help='JPEG质量（指定 --target-bytes 时为上限）')
+    parser.add_argument('--max-dim', type=int, default=None, help='长边最大像素')
+    parser.add_argument('--target-bytes', type=int, default=None, help='目标文件大小（字节）')
+    parser.add_argument('--scales', default='1.0', help='目标大小无法满足时依次尝试的缩放比例，如 1,0.85,0.7,0.5')
+    parser.add_argument('--keep-metadata', action='store_true', help='保留 EXIF/ICC 信息')
+    parser.add_argument('--workers', type=int, default=None, help='进程数，默认CPU核数')
+    args = parser.parse_args()
+    scales = tuple(float(v) for v in args.scales.split(',') if v.strip())
+    if not scales:
+        parser.error('--scales 至少需要一个缩放比例')
+
+    compress_folder(args.folder_src, args.folder_dst, workers=args.workers, quality=args.quality,
+                    max_dim=args.max_dim, target_bytes=args.target_bytes, keep_metadata=args.keep_metadata,
+                    scales=scales)
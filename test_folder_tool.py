@@ -0,0 +1,31 @@
+# -*- coding: UTF-8 -*-
+import os
+
+from folder_tool import FolderIndex
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'w').close()
+
+
+def test_folder_index_nested_roots_share_index(tmp_path):
+    tree = str(tmp_path / 'tree')
+    db = str(tmp_path / 'index.db')
+    for rel_path in ('x.txt', 'a/y.txt', 'a/b/z.txt'):
+        _touch(os.path.join(tree, rel_path))
+
+    index = FolderIndex(tree, db)
+    index.refresh()
+    index.close()
+
+    _touch(os.path.join(tree, 'a', 'new.txt'))
+    index = FolderIndex(os.path.join(tree, 'a'), db)
+    assert index.refresh()['added'] == [os.path.join(tree, 'a', 'new.txt')]
+    index.close()
+
+    index = FolderIndex(tree, db)
+    assert index.refresh() == {'added': [], 'changed': [], 'removed': []}
+    assert index.files() == [os.path.join(tree, rel_path)
+                             for rel_path in ('a/b/z.txt', 'a/new.txt', 'a/y.txt', 'x.txt')]
+    index.close()
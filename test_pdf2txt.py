@@ -0,0 +1,62 @@
+# -*- coding: UTF-8 -*-
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+pytest.importorskip('pytesseract')
+pytest.importorskip('pdf2image')
+import pdf2txt  # noqa: E402
+
+
+# 白底黑字的测试图像
+def _text_image(text='Hello 2016'):
+    image = Image.new('L', (600, 120), 255)
+    draw = ImageDraw.Draw(image)
+    draw.text((20, 30), text, fill=0, font=ImageFont.load_default(size=48))
+    return image
+
+
+def test_ocr_page_tesserocr():
+    tesserocr = pytest.importorskip('tesserocr')
+    if 'eng' not in tesserocr.get_languages()[1]:
+        pytest.skip('tesserocr has no eng traineddata')
+    text = pdf2txt._ocr_page(_text_image(), lang='eng', config='--psm 6', backend='tesserocr')
+    assert 'Hello' in text
+    # 同一 (lang, psm) 复用常驻引擎
+    assert pdf2txt._tesserocr_api('eng', '--psm 6') is pdf2txt._tesserocr_api('eng', '--psm 6')
+
+
+def test_extract_rules_numbered_backreference():
+    rules = pdf2txt.ExtractRules({'a': 'zz', 'b': r'(\d)\1'})
+    assert rules.match('11') == 'b'
+    assert rules.match('12') is None
+    assert pdf2txt.ExtractRules({'a': r'(\w)\1'}).match('xx') == 'a'
+
+
+def test_extract_rules_inline_flags():
+    rules = pdf2txt.ExtractRules({'a': '^Hello', 'b': '(?i)world'})
+    assert rules.match('WORLD') == 'b'
+    assert rules.match('Hello') == 'a'
+
+
+def test_extract_rules_duplicate_group_names():
+    rules = pdf2txt.ExtractRules({'a': r'(?P<n>\d+)kg', 'b': r'(?P<n>\d+)mm'})
+    assert rules.match('5mm') == 'b'
+    assert rules.match('5kg') == 'a'
+
+
+def test_extract_rules_order():
+    # 位置靠前者优先，位置相同时先定义的规则优先，与组合正则的语义一致
+    rules = pdf2txt.ExtractRules({'a': 'b', 'b': r'(a)'}, keywords={'c': ['ab']})
+    assert rules.match('ab') == 'b'
+    rules = pdf2txt.ExtractRules({'a': r'(a)b', 'b': 'ab'})
+    assert rules.match('xab') == 'a'
+    assert [name for name, _ in rules.scan(['xa', 'b\nno\n', 'ab'])] == ['a', 'a']
+
+
+def test_extract_rules_empty_keywords():
+    rules = pdf2txt.ExtractRules({'h': '^Hello'}, keywords={'k': ['', 'abc']})
+    assert rules.match('anything') is None
+    assert rules.match('xabc') == 'k'
+    for words in ([], ['']):
+        with pytest.raises(ValueError):
+            pdf2txt.ExtractRules({'h': '^Hello'}, keywords={'k': words})